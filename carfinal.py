@@ -11,9 +11,22 @@ from sklearn.model_selection import train_test_split, GridSearchCV, cross_val_sc
 from sklearn.preprocessing import LabelEncoder, StandardScaler
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 from sklearn.metrics import r2_score, mean_absolute_error, mean_squared_error
+from scipy import sparse
 from datetime import datetime
 import io
 import base64
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
 
 # ========================================
 # COMPREHENSIVE GLOBAL CAR DATABASE
@@ -289,24 +302,820 @@ CAR_CONDITIONS = ["Excellent", "Very Good", "Good", "Fair", "Poor"]
 OWNER_TYPES = ["First", "Second", "Third", "Fourth & Above"]
 INSURANCE_STATUS = ["Comprehensive", "Third Party", "Expired", "No Insurance"]
 COLORS = ["White", "Black", "Silver", "Grey", "Red", "Blue", "Brown", "Green", "Yellow", "Orange", "Purple", "Gold", "Other"]
-CITIES = ["Delhi", "Mumbai", "Bangalore", "Chennai", "Pune", "Hyderabad", "Kolkata", "Ahmedabad", "Surat", "Jaipur", 
+CITIES = ["Delhi", "Mumbai", "Bangalore", "Chennai", "Pune", "Hyderabad", "Kolkata", "Ahmedabad", "Surat", "Jaipur",
           "Lucknow", "Chandigarh", "London", "New York", "Tokyo", "Dubai", "Paris", "Berlin", "Los Angeles", "Shanghai"]
 
+# ========================================
+# CATALOG NAME MATCHING
+# ========================================
+
+# Keys are normalized names (see normalize_name)
+BRAND_ALIASES = {
+    'maruti': 'Maruti Suzuki', 'msil': 'Maruti Suzuki',
+    'mercedes': 'Mercedes-Benz', 'merc': 'Mercedes-Benz', 'benz': 'Mercedes-Benz', 'mb': 'Mercedes-Benz',
+    'vw': 'Volkswagen', 'volks wagen': 'Volkswagen',
+    'chevy': 'Chevrolet', 'landrover': 'Land Rover', 'range rover': 'Land Rover',
+    'rolls royce': 'Rolls-Royce', 'rr': 'Rolls-Royce', 'alfa': 'Alfa Romeo',
+    'lambo': 'Lamborghini', 'mg motor': 'MG', 'morris garages': 'MG',
+    'tata motors': 'Tata', 'mahindra mahindra': 'Mahindra', 'm m': 'Mahindra'
+}
+MODEL_ALIASES = {
+    ('Maruti Suzuki', 'brezza'): 'Vitara Brezza',
+    ('Maruti Suzuki', 'wagonr'): 'Wagon R',
+    ('Toyota', 'corolla'): 'Corolla Altis',
+    ('Toyota', 'innova'): 'Innova Crysta',
+    ('Toyota', 'hyryder'): 'Urban Cruiser Hyryder',
+    ('Ford', 'mustang mach e'): 'Mach-E',
+    ('Hyundai', 'grand i10'): 'Grand i10 Nios',
+    ('Land Rover', 'evoque'): 'Range Rover Evoque',
+    ('Land Rover', 'velar'): 'Range Rover Velar'
+}
+FUEL_ALIASES = {
+    'ev': 'Electric', 'bev': 'Electric', 'electric vehicle': 'Electric', 'battery electric': 'Electric',
+    'gasoline': 'Petrol', 'gas': 'Petrol', 'hev': 'Hybrid', 'phev': 'Hybrid', 'plug in hybrid': 'Hybrid',
+    'cng petrol': 'CNG', 'lpg petrol': 'LPG', 'fcev': 'Hydrogen'
+}
+TRANSMISSION_ALIASES = {
+    'mt': 'Manual', 'at': 'Automatic', 'auto': 'Automatic', 'tc': 'Automatic',
+    'dsg': 'DCT', 'dual clutch': 'Dual-Clutch', 'e cvt': 'CVT', 'ivt': 'CVT'
+}
+CONDITION_ALIASES = {
+    'new': 'Excellent', 'like new': 'Excellent', 'mint': 'Excellent',
+    'used': 'Good', 'average': 'Fair', 'damaged': 'Poor'
+}
+OWNER_ALIASES = {
+    '1st': 'First', '1': 'First', '2nd': 'Second', '2': 'Second', '3rd': 'Third', '3': 'Third',
+    '4th': 'Fourth & Above', '4': 'Fourth & Above', '4th above': 'Fourth & Above', 'fourth': 'Fourth & Above'
+}
+# Categorical inputs normalized alongside brand/model: (column, canonical values, aliases)
+CATEGORY_VOCABULARIES = [
+    ('Fuel_Type', FUEL_TYPES, FUEL_ALIASES),
+    ('Transmission', TRANSMISSIONS, TRANSMISSION_ALIASES),
+    ('Condition', CAR_CONDITIONS, CONDITION_ALIASES),
+    ('Owner_Type', OWNER_TYPES, OWNER_ALIASES)
+]
+CATALOG_MATCH_THRESHOLD = 0.8     # minimum edit similarity for a fuzzy match
+CATALOG_CANDIDATES = 5            # trigram-index shortlist scored per lookup
+ALIAS_CONFIDENCE = 0.95
+
+def normalize_name(value):
+    """Lowercase ASCII with punctuation collapsed to single spaces"""
+    text = unicodedata.normalize('NFKD', str(value)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
+def name_designators(text):
+    """Digit groups and one- or two-letter tokens of a normalized name.
+
+    These tell sibling models apart ("ioniq 5"/"ioniq 6", "s5"/"rs5",
+    "a class"/"b class"), so a fuzzy match must keep them unchanged.
+    """
+    tokens = re.sub(r'(?<=[a-z])(?=[0-9])|(?<=[0-9])(?=[a-z])', ' ', text).split()
+    return tuple(t for t in tokens if t.isdigit() or len(t) <= 2)
+
+class TrigramIndex:
+    """Inverted character-trigram index for fuzzy lookup of a small vocabulary.
+
+    Trigram overlap shortlists candidates; the shortlist is then scored by
+    edit similarity of the space-free names. Candidates whose designators
+    differ from the input's are never returned, so a typo cannot move a
+    car onto a sibling model.
+    """
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.compact = [normalize_name(n).replace(' ', '') for n in self.names]
+        self.designators = [name_designators(normalize_name(n)) for n in self.names]
+        self.postings = {}
+        for i, name in enumerate(self.compact):
+            for gram in self._trigrams(name):
+                self.postings.setdefault(gram, []).append(i)
+
+    @staticmethod
+    def _trigrams(compact):
+        padded = f"  {compact} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def best_match(self, text):
+        """(name, similarity) of the closest entry, or (None, 0.0)"""
+        compact = text.replace(' ', '')
+        designators = name_designators(text)
+        shared = Counter(i for gram in self._trigrams(compact) for i in self.postings.get(gram, ()))
+        best_name, best_score = None, 0.0
+        for i, _ in shared.most_common(CATALOG_CANDIDATES):
+            # A longer name that extends a catalog entry ("Marazzo EV") is a
+            # different variant, not a misspelling
+            if compact.startswith(self.compact[i]):
+                continue
+            if designators != self.designators[i]:
+                continue
+            score = SequenceMatcher(None, compact, self.compact[i]).ratio()
+            if score > best_score:
+                best_name, best_score = self.names[i], score
+        return best_name, best_score
+
+class CatalogMatcher:
+    """Maps free-text brand/model names onto CAR_DATABASE labels.
+
+    Lookup order is exact normalized name, alias table, then the trigram
+    index; each match carries a confidence (1.0 exact, ALIAS_CONFIDENCE for
+    aliases, the similarity score for fuzzy matches). Results are memoized,
+    and frames are matched on their unique values only.
+    """
+
+    def __init__(self, database=CAR_DATABASE):
+        self.brands = {}
+        for brand in database:
+            self.brands[normalize_name(brand)] = brand
+            self.brands[normalize_name(brand).replace(' ', '')] = brand
+        self.brand_aliases = dict(BRAND_ALIASES)
+        self.brand_index = TrigramIndex(database.keys())
+        self.models = {}
+        self.model_index = {}
+        for brand, info in database.items():
+            lookup = {}
+            for model in info['models']:
+                lookup[normalize_name(model)] = model
+                lookup[normalize_name(model).replace(' ', '')] = model
+            self.models[brand] = lookup
+            self.model_index[brand] = TrigramIndex(info['models'])
+        self._memo = {}
+
+    def _split_brand_prefix(self, text):
+        tokens = text.split()
+        # Longest token prefix first, so "vw virtus" resolves to Volkswagen + "virtus"
+        for end in range(len(tokens), 0, -1):
+            prefix = ' '.join(tokens[:end])
+            remainder = ' '.join(tokens[end:])
+            if prefix in self.brands:
+                return self.brands[prefix], 1.0, remainder
+            if prefix.replace(' ', '') in self.brands:
+                return self.brands[prefix.replace(' ', '')], 1.0, remainder
+            if prefix in self.brand_aliases:
+                return self.brand_aliases[prefix], ALIAS_CONFIDENCE, remainder
+        return None, 0.0, ''
+
+    def match_brand(self, value):
+        """(canonical brand or None, confidence, normalized remainder of the text)"""
+        text = normalize_name(value)
+        brand, confidence, remainder = self._split_brand_prefix(text)
+        if brand is not None:
+            return brand, confidence, remainder
+        brand, score = self.brand_index.best_match(text)
+        if score >= CATALOG_MATCH_THRESHOLD:
+            return brand, score, ''
+        return None, score, ''
+
+    def match_model(self, brand, value):
+        """(canonical model or None, confidence) within one brand"""
+        text = normalize_name(value)
+        # Dealer files often repeat the brand in the model column
+        _, _, remainder = self._split_brand_prefix(text)
+        candidates = [text, remainder] if remainder else [text]
+        lookup = self.models[brand]
+        for candidate in candidates:
+            if candidate in lookup:
+                return lookup[candidate], 1.0
+            if candidate.replace(' ', '') in lookup:
+                return lookup[candidate.replace(' ', '')], 1.0
+            alias = MODEL_ALIASES.get((brand, candidate)) or MODEL_ALIASES.get((brand, candidate.replace(' ', '')))
+            if alias:
+                return alias, ALIAS_CONFIDENCE
+        model, score = max((self.model_index[brand].best_match(c) for c in candidates), key=lambda m: m[1])
+        if score >= CATALOG_MATCH_THRESHOLD:
+            return model, score
+        return None, score
+
+    def match(self, brand, model):
+        """Canonical (brand, model, confidence); unmatched parts keep their input value"""
+        key = (brand, model)
+        if pd.isna(brand):
+            return brand, model, 0.0
+        if key not in self._memo:
+            canonical_brand, brand_conf, remainder = self.match_brand(brand)
+            if canonical_brand is None:
+                self._memo[key] = (brand, model, 0.0)
+            else:
+                # A brand cell like "VW Virtus" carries the model when the model cell is empty
+                model_text = model if pd.notna(model) and str(model).strip() else remainder
+                canonical_model, model_conf = self.match_model(canonical_brand, model_text)
+                if canonical_model is None:
+                    self._memo[key] = (canonical_brand, model, 0.0)
+                else:
+                    self._memo[key] = (canonical_brand, canonical_model, min(brand_conf, model_conf))
+        return self._memo[key]
+
+    @staticmethod
+    def canonical_category(value, choices, aliases):
+        text = normalize_name(value)
+        for choice in choices:
+            if normalize_name(choice) == text:
+                return choice
+        return aliases.get(text, value)
+
+    def canonicalize_input(self, input_data):
+        """Copy of a single input dict with canonical catalog labels"""
+        result = dict(input_data)
+        if 'Brand' in result and 'Model' in result:
+            result['Brand'], result['Model'], _ = self.match(result['Brand'], result['Model'])
+        for column, choices, aliases in CATEGORY_VOCABULARIES:
+            if column in result:
+                result[column] = self.canonical_category(result[column], choices, aliases)
+        return result
+
+    def canonicalize_frame(self, df):
+        """Canonical copy of a frame plus a per-unique-pair match report.
+
+        The report has one row per distinct input (Brand, Model) with its
+        canonical labels, Confidence (0 when unmatched) and row count.
+        """
+        result = df.copy()
+        report = None
+        if 'Brand' in df.columns and 'Model' in df.columns:
+            codes, first = unique_row_codes(df, ['Brand', 'Model'])
+            pairs = df[['Brand', 'Model']].iloc[first]
+            matches = [self.match(b, m) for b, m in zip(pairs['Brand'], pairs['Model'])]
+            canonical = pd.DataFrame(matches, columns=['Canonical_Brand', 'Canonical_Model', 'Confidence'])
+            result['Brand'] = canonical['Canonical_Brand'].to_numpy(dtype=object)[codes]
+            result['Model'] = canonical['Canonical_Model'].to_numpy(dtype=object)[codes]
+            report = pd.concat([pairs.reset_index(drop=True), canonical], axis=1)
+            report['Rows'] = np.bincount(codes, minlength=len(first)) if len(codes) else []
+        for column, choices, aliases in CATEGORY_VOCABULARIES:
+            if column in df.columns:
+                values = df[column].dropna().unique()
+                mapping = {v: self.canonical_category(v, choices, aliases) for v in values}
+                result[column] = df[column].map(mapping).where(df[column].notna(), df[column])
+        return result, report
+
+# ========================================
+# MODEL FEATURES
+# ========================================
+
+MODEL_FEATURES = ['Brand', 'Model', 'Year', 'Fuel_Type', 'Transmission', 'Mileage', 'Condition']
+CATEGORICAL_FEATURES = ['Brand', 'Model', 'Fuel_Type', 'Transmission', 'Condition']
+RULE_FEATURES = MODEL_FEATURES + ['Owner_Type', 'Insurance_Status', 'Registration_City']
+# Neutral values for rule inputs a batch file may not carry
+RULE_DEFAULTS = {'Owner_Type': 'First', 'Insurance_Status': 'Third Party', 'Registration_City': ''}
+EXPLAIN_CHUNK_SIZE = 5000
+
+def unique_row_codes(df, columns):
+    """Factorize rows on columns.
+
+    Returns (codes, first) where codes[i] numbers row i's distinct value
+    combination in order of first appearance and first[k] is the position
+    of the first row with code k.
+    """
+    if len(df) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    codes = df.groupby(columns, sort=False, dropna=False).ngroup().to_numpy()
+    _, first = np.unique(codes, return_index=True)
+    return codes, first
+
+def dataset_fingerprint(df):
+    """Content hash of a frame's columns and values, ignoring its index"""
+    digest = hashlib.sha1(json.dumps([str(c) for c in df.columns]).encode('utf-8'))
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+# ========================================
+# RULE-BASED PRICING FACTORS
+# ========================================
+
+FUEL_MULTIPLIERS = {
+    "Petrol": 1.0, "Diesel": 1.12, "CNG": 0.92, "Electric": 1.65,
+    "Hybrid": 1.35, "LPG": 0.88, "Hydrogen": 1.75
+}
+TRANSMISSION_MULTIPLIERS = {
+    "Manual": 1.0, "Automatic": 1.18, "CVT": 1.15, "DCT": 1.22,
+    "AMT": 1.08, "Sequential": 1.25, "Dual-Clutch": 1.23
+}
+CONDITION_MULTIPLIERS = {
+    "Excellent": 0.92, "Very Good": 0.85, "Good": 0.75, "Fair": 0.60, "Poor": 0.45
+}
+OWNER_MULTIPLIERS = {
+    "First": 1.0, "Second": 0.88, "Third": 0.75, "Fourth & Above": 0.60
+}
+CITY_PREMIUM = {
+    "Delhi": 1.04, "Mumbai": 1.06, "Bangalore": 1.05, "Chennai": 1.02,
+    "Pune": 1.03, "Hyderabad": 1.03, "London": 1.15, "New York": 1.18,
+    "Tokyo": 1.12, "Dubai": 1.20, "Paris": 1.14, "Berlin": 1.08
+}
+INSURANCE_MULTIPLIERS = {"Comprehensive": 1.03, "Expired": 0.98}
+
+# Rule inputs that only select a multiplier; values missing from a table price at 1.0
+RULE_LOOKUP_MULTIPLIERS = {
+    'Fuel_Type': FUEL_MULTIPLIERS, 'Transmission': TRANSMISSION_MULTIPLIERS,
+    'Registration_City': CITY_PREMIUM, 'Insurance_Status': INSURANCE_MULTIPLIERS
+}
+
+# Depreciation for cars 0-5 years old; older cars lose 5% more per year, capped at 75%
+AGE_DEPRECIATION = [0.10, 0.25, 0.35, 0.45, 0.53, 0.60]
+
+# Mileage bracket upper bounds (inclusive) and their depreciation
+MILEAGE_BRACKETS = [10000, 30000, 50000, 80000, 120000, 200000]
+MILEAGE_IMPACTS = [0, 0.03, 0.07, 0.12, 0.18, 0.25, 0.35]
+
+# Both helpers coerce with float() so non-numeric input raises and callers
+# fall back, while numeric strings are priced like the numbers they hold
+def age_depreciation(car_age):
+    car_age = float(car_age)
+    if 0 <= car_age < len(AGE_DEPRECIATION) and car_age == int(car_age):
+        return AGE_DEPRECIATION[int(car_age)]
+    return min(0.75, 0.60 + (car_age - 5) * 0.05)
+
+def mileage_bracket(mileage):
+    return int(np.searchsorted(MILEAGE_BRACKETS, float(mileage), side='left'))
+
+def mileage_impact(mileage):
+    return MILEAGE_IMPACTS[mileage_bracket(mileage)]
+
+def rule_prices_array(base_price, fuel, transmission, car_age, mileage, condition, owner, city, insurance):
+    """Vectorized calculate_accurate_price over broadcastable arrays of factors.
+
+    Multiplies in the same order as the scalar path so results are identical.
+    """
+    car_age = np.asarray(car_age, dtype=float)
+    table = np.asarray(AGE_DEPRECIATION)
+    in_table = (car_age >= 0) & (car_age < len(table)) & (car_age == np.floor(car_age))
+    depreciation = np.where(in_table, table[np.clip(car_age, 0, len(table) - 1).astype(int)],
+                            np.minimum(0.75, 0.60 + (car_age - 5) * 0.05))
+    impact = np.asarray(MILEAGE_IMPACTS)[np.searchsorted(MILEAGE_BRACKETS, mileage, side='left')]
+    price = np.asarray(base_price, dtype=float) * fuel * transmission * (1 - (depreciation + impact))
+    price = price * condition * owner * city * insurance
+    return np.maximum(100000, price.astype(np.int64))
+
+# ========================================
+# TRAINING DATA VALIDATION RULES
+# ========================================
+
+QUARANTINE_PATH = "quarantined_rows.csv"
+
+VALIDATION_RANGES = {
+    'Year': (1950, None),    # None: the current year, read at validation time
+    'Mileage': (0, 2000000),
+    'Price': (1, 10000000000)
+}
+
+# Each rejection reason owns one bit so all checks can be OR-ed into a single
+# integer column and decoded once per distinct combination.
+REJECTION_REASONS = [
+    'missing_value', 'non_numeric', 'year_out_of_range', 'mileage_out_of_range',
+    'price_out_of_range', 'unknown_brand', 'unknown_model', 'unknown_fuel_type',
+    'unknown_transmission', 'duplicate_car_id'
+]
+
+# ========================================
+# DRIFT MONITORING
+# ========================================
+
+DRIFT_NUMERIC_FEATURES = ['Year', 'Mileage']
+DRIFT_CATEGORICAL_FEATURES = ['Brand', 'Model', 'Fuel_Type', 'Transmission', 'Condition']
+DRIFT_BINS = 10
+DRIFT_THRESHOLD = 0.25       # PSI above this is conventionally a significant shift
+DRIFT_MIN_SAMPLES = 30       # too few live requests make PSI meaningless
+
+class FeatureDriftMonitor:
+    """Compact, mergeable running statistics per feature.
+
+    Numeric features keep a fixed-edge histogram plus count/mean/M2 moments;
+    categorical features keep value counts. No raw rows are retained, and two
+    monitors sharing the same bin edges can be merged.
+    """
+
+    def __init__(self, numeric_edges, categorical_features):
+        self.numeric_edges = {f: np.asarray(e, dtype=float) for f, e in numeric_edges.items()}
+        self.categorical_features = list(categorical_features)
+        self.reset()
+
+    @classmethod
+    def from_training_data(cls, df, numeric_features=DRIFT_NUMERIC_FEATURES,
+                           categorical_features=DRIFT_CATEGORICAL_FEATURES, bins=DRIFT_BINS):
+        """Build reference statistics with quantile bin edges from training data"""
+        quantiles = np.linspace(0, 1, bins + 1)[1:-1]
+        edges = {}
+        for feature in numeric_features:
+            values = pd.to_numeric(df[feature], errors='coerce').dropna().to_numpy(dtype=float)
+            edges[feature] = np.unique(np.quantile(values, quantiles)) if len(values) else np.array([])
+        monitor = cls(edges, categorical_features)
+        monitor.update_batch(df)
+        return monitor
+
+    def spawn(self):
+        """Empty monitor sharing this monitor's bin edges"""
+        return FeatureDriftMonitor(self.numeric_edges, self.categorical_features)
+
+    def reset(self):
+        self.count = 0
+        self.histograms = {f: np.zeros(len(e) + 1, dtype=np.int64) for f, e in self.numeric_edges.items()}
+        self.moments = {f: (0, 0.0, 0.0) for f in self.numeric_edges}
+        self.category_counts = {f: {} for f in self.categorical_features}
+
+    def _add_moments(self, feature, n_b, mean_b, m2_b):
+        # Chan et al. parallel update, so batches and merges share one code path
+        n_a, mean_a, m2_a = self.moments[feature]
+        n = n_a + n_b
+        if n == 0:
+            return
+        delta = mean_b - mean_a
+        self.moments[feature] = (n, mean_a + delta * n_b / n, m2_a + m2_b + delta ** 2 * n_a * n_b / n)
+
+    def update(self, input_data):
+        """Add a single prediction request"""
+        self.count += 1
+        for feature, edges in self.numeric_edges.items():
+            try:
+                value = float(input_data[feature])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if np.isnan(value):
+                continue
+            self.histograms[feature][np.searchsorted(edges, value, side='right')] += 1
+            self._add_moments(feature, 1, value, 0.0)
+        for feature in self.categorical_features:
+            if feature in input_data:
+                counts = self.category_counts[feature]
+                key = str(input_data[feature])
+                counts[key] = counts.get(key, 0) + 1
+
+    def update_batch(self, df):
+        """Add a DataFrame of rows in one vectorized pass"""
+        self.count += len(df)
+        for feature, edges in self.numeric_edges.items():
+            if feature not in df.columns:
+                continue
+            values = pd.to_numeric(df[feature], errors='coerce').dropna().to_numpy(dtype=float)
+            if len(values) == 0:
+                continue
+            buckets = np.searchsorted(edges, values, side='right')
+            self.histograms[feature] += np.bincount(buckets, minlength=len(edges) + 1)
+            self._add_moments(feature, len(values), values.mean(), ((values - values.mean()) ** 2).sum())
+        for feature in self.categorical_features:
+            if feature not in df.columns:
+                continue
+            counts = self.category_counts[feature]
+            for key, n in df[feature].dropna().astype(str).value_counts().items():
+                counts[key] = counts.get(key, 0) + int(n)
+
+    def merge(self, other):
+        """Fold another monitor's statistics into this one"""
+        for feature, edges in self.numeric_edges.items():
+            if not np.array_equal(edges, other.numeric_edges.get(feature)):
+                raise ValueError(f"Cannot merge monitors with different bin edges for '{feature}'")
+        self.count += other.count
+        for feature in self.numeric_edges:
+            self.histograms[feature] += other.histograms[feature]
+            self._add_moments(feature, *other.moments[feature])
+        for feature in self.categorical_features:
+            counts = self.category_counts[feature]
+            for key, n in other.category_counts.get(feature, {}).items():
+                counts[key] = counts.get(key, 0) + n
+        return self
+
+    def mean(self, feature):
+        n, mean, _ = self.moments[feature]
+        return mean if n else float('nan')
+
+    @staticmethod
+    def _psi(expected, actual, smoothing=0.5):
+        expected = np.asarray(expected, dtype=float)
+        actual = np.asarray(actual, dtype=float)
+        n_expected, n_actual = expected.sum(), actual.sum()
+        if n_expected == 0 or n_actual == 0:
+            return float('nan')
+        occupied = (expected + actual) > 0
+        expected, actual = expected[occupied], actual[occupied]
+        k = len(expected)
+        e = (expected + smoothing) / (n_expected + smoothing * k)
+        a = (actual + smoothing) / (n_actual + smoothing * k)
+        psi = float(np.sum((a - e) * np.log(a / e)))
+        # Identical distributions still score about (k - 1) * (1/n_e + 1/n_a) from
+        # sampling noise alone, which swamps high-cardinality features like Model
+        return float(max(0.0, psi - (k - 1) * (1 / n_expected + 1 / n_actual)))
+
+    def drift_scores(self, reference):
+        """Population Stability Index of this monitor against a reference"""
+        scores = {}
+        for feature in self.numeric_edges:
+            scores[feature] = self._psi(reference.histograms[feature], self.histograms[feature])
+        for feature in self.categorical_features:
+            ref_counts = reference.category_counts.get(feature, {})
+            live_counts = self.category_counts[feature]
+            keys = sorted(set(ref_counts) | set(live_counts))
+            scores[feature] = self._psi([ref_counts.get(k, 0) for k in keys],
+                                        [live_counts.get(k, 0) for k in keys])
+        return scores
+
+# ========================================
+# PERSISTENT VALUATION CACHE
+# ========================================
+
+VALUATION_CACHE_PATH = "valuation_cache.sqlite"
+VALUATION_CACHE_TTL = 7 * 24 * 3600      # seconds
+VALUATION_CACHE_MAX_ENTRIES = 200000
+# Bump when rule pricing or name matching changes in code rather than in the tables below
+RULE_ENGINE_REVISION = 2
+
+def rule_engine_version():
+    """Cache version for rule-engine prices, derived from everything they depend on.
+
+    Editing the catalog, a multiplier table or the name-matching vocabularies
+    yields a new version, so a deploy never serves prices cached by the old rules.
+    """
+    inputs = [
+        RULE_ENGINE_REVISION, CAR_DATABASE, FUEL_MULTIPLIERS, TRANSMISSION_MULTIPLIERS,
+        CONDITION_MULTIPLIERS, OWNER_MULTIPLIERS, CITY_PREMIUM, INSURANCE_MULTIPLIERS,
+        AGE_DEPRECIATION, MILEAGE_BRACKETS, MILEAGE_IMPACTS, BRAND_ALIASES, MODEL_ALIASES,
+        CATEGORY_VOCABULARIES, CATALOG_MATCH_THRESHOLD
+    ]
+    return "rules-" + hashlib.sha1(repr(inputs).encode('utf-8')).hexdigest()[:12]
+
+RULE_ENGINE_VERSION = rule_engine_version()
+
+class ValuationCache:
+    """SQLite-backed price cache with TTL expiry and LRU eviction.
+
+    Entries are keyed by a normalized input string plus the model version
+    that produced them. A connection is shared across Streamlit threads
+    behind a lock; WAL mode lets several app processes use the same file.
+    """
+
+    def __init__(self, path=VALUATION_CACHE_PATH, ttl=VALUATION_CACHE_TTL,
+                 max_entries=VALUATION_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # WAL stays consistent without an fsync per commit; a crash loses only recent entries
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS valuations ("
+                " key TEXT NOT NULL, model_version TEXT NOT NULL, price INTEGER NOT NULL,"
+                " created_at REAL NOT NULL, last_access REAL NOT NULL,"
+                " PRIMARY KEY (key, model_version))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON valuations (last_access)")
+            self._size = self._conn.execute("SELECT COUNT(*) FROM valuations").fetchone()[0]
+
+    def get(self, key, model_version):
+        now = time.time()
+        try:
+            with self._lock, self._conn:
+                row = self._conn.execute(
+                    "SELECT price FROM valuations WHERE key = ? AND model_version = ? AND created_at >= ?",
+                    (key, model_version, now - self.ttl)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE valuations SET last_access = ? WHERE key = ? AND model_version = ?",
+                        (now, key, model_version)
+                    )
+        except sqlite3.Error:
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, model_version, price):
+        now = time.time()
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO valuations VALUES (?, ?, ?, ?, ?)",
+                    (key, model_version, int(price), now, now)
+                )
+                self._size += 1
+                if self._size > self.max_entries:
+                    self._evict(now)
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, now):
+        # Drop expired rows first, then least recently used down to 90% capacity
+        self._conn.execute("DELETE FROM valuations WHERE created_at < ?", (now - self.ttl,))
+        self._size = self._conn.execute("SELECT COUNT(*) FROM valuations").fetchone()[0]
+        excess = self._size - int(self.max_entries * 0.9)
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM valuations WHERE rowid IN "
+                "(SELECT rowid FROM valuations ORDER BY last_access LIMIT ?)", (excess,)
+            )
+            self._size -= excess
+
+    def invalidate(self, model_version=None):
+        """Remove entries of one model version, or everything"""
+        try:
+            with self._lock, self._conn:
+                if model_version is None:
+                    self._conn.execute("DELETE FROM valuations")
+                else:
+                    self._conn.execute("DELETE FROM valuations WHERE model_version = ?", (model_version,))
+                self._size = self._conn.execute("SELECT COUNT(*) FROM valuations").fetchone()[0]
+        except sqlite3.Error:
+            pass
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': self._size
+        }
+
+# ========================================
+# PROGRESSIVE TRAINING
+# ========================================
+
+PROGRESSIVE_INITIAL_SAMPLE = 5000
+PROGRESSIVE_GROWTH = 4            # each stage trains on this many times more rows
+PROGRESSIVE_HOLDOUT = 0.1
+PROGRESSIVE_MAX_HOLDOUT = 50000
+PROGRESSIVE_MIN_GAIN = 0.005      # holdout R² gain below this counts as a plateau
+PROGRESSIVE_STRATA = ['Brand', 'Model']
+
+def stratified_positions(df, strata, seed=42):
+    """Random position in [0, 1) of each row within its stratum.
+
+    Taking rows with position < f gives a proportional stratified sample of
+    fraction f that always includes every stratum, and samples for growing
+    f are nested.
+    """
+    rng = np.random.default_rng(seed)
+    keys = df[strata].copy()
+    keys['_draw'] = rng.random(len(df))
+    groups = keys.groupby(strata, sort=False, dropna=False)['_draw']
+    rank = groups.rank(method='first').to_numpy() - 1
+    return rank / groups.transform('size').to_numpy()
+
+class ProgressiveTrainingJob:
+    """Fits the forest on stratified samples of increasing size in a background thread.
+
+    A fixed stratified holdout scores every stage; each stage's model is
+    published to the predictor as soon as it is fitted, and the job stops once
+    holdout R² stops improving. If it never plateaus, a last unscored stage
+    refits on all rows, holdout included. Stage results
+    are appended to `stages` for the UI to poll; the worker never calls
+    Streamlit.
+    """
+
+    def __init__(self, predictor, df_clean, source=None):
+        self.predictor = predictor
+        self.df_clean = df_clean
+        self.source = source
+        self.stages = []
+        self.live_stage = None    # stage whose model is currently published
+        self.status = "pending"
+        self.error = None
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.status = "running"
+        self._thread.start()
+        return self
+
+    def cancel(self, wait=False):
+        """Stop before the next publish; with wait, block until the worker has exited"""
+        self._cancel.set()
+        if wait and self._thread.is_alive():
+            self._thread.join()
+
+    @property
+    def done(self):
+        return self.status in ("finished", "plateaued", "cancelled", "failed")
+
+    def sample_sizes(self, pool_size):
+        sizes = []
+        size = min(PROGRESSIVE_INITIAL_SAMPLE, pool_size)
+        while size < pool_size:
+            sizes.append(size)
+            size *= PROGRESSIVE_GROWTH
+        return sizes + [pool_size]
+
+    def _run(self):
+        try:
+            df = self.df_clean
+            X, encoders = self.predictor.encode_training_features(df)
+            y = df['Price'].to_numpy()
+            positions = stratified_positions(df, PROGRESSIVE_STRATA)
+            holdout_fraction = min(PROGRESSIVE_HOLDOUT, PROGRESSIVE_MAX_HOLDOUT / len(df))
+            holdout = positions >= 1 - holdout_fraction
+            pool = np.flatnonzero(~holdout)
+            # Order the pool by position so every prefix is a stratified sample
+            pool = pool[np.argsort(positions[pool], kind='stable')]
+            X_holdout, y_holdout = X[holdout], y[holdout]
+
+            best_r2 = None
+            for size in self.sample_sizes(len(pool)):
+                if self._cancel.is_set():
+                    self.status = "cancelled"
+                    return
+                started = time.time()
+                rows = pool[:size]
+                model = RandomForestRegressor(n_estimators=100, random_state=42)
+                model.fit(X.iloc[rows], y[rows])
+                # A stop requested during the fit must not publish its model
+                if self._cancel.is_set():
+                    self.status = "cancelled"
+                    return
+                if len(y_holdout):
+                    y_pred = model.predict(X_holdout)
+                    r2 = r2_score(y_holdout, y_pred) if len(y_holdout) > 1 else float('nan')
+                    mae = mean_absolute_error(y_holdout, y_pred)
+                else:
+                    r2, mae = float('nan'), float('nan')
+                self.predictor._publish_model(model, encoders, df, self.source)
+                stage = {
+                    'Stage': len(self.stages) + 1,
+                    'Training Rows': size,
+                    'Holdout R²': r2,
+                    'Holdout MAE': mae,
+                    'Seconds': time.time() - started
+                }
+                self.stages.append(stage)
+                self.live_stage = stage
+                if best_r2 is not None and r2 - best_r2 < PROGRESSIVE_MIN_GAIN:
+                    if r2 < best_r2:
+                        # Holdout accuracy fell; put the best-scoring stage's model back
+                        self.predictor._publish_model(best_model, encoders, df, self.source)
+                        self.live_stage = best_stage
+                    self.status = "plateaued"
+                    return
+                if best_r2 is None or r2 > best_r2:
+                    best_r2, best_model, best_stage = r2, model, stage
+            if holdout.any():
+                if self._cancel.is_set():
+                    self.status = "cancelled"
+                    return
+                started = time.time()
+                model = RandomForestRegressor(n_estimators=100, random_state=42)
+                model.fit(X, y)
+                if self._cancel.is_set():
+                    self.status = "cancelled"
+                    return
+                self.predictor._publish_model(model, encoders, df, self.source)
+                self.stages.append({
+                    'Stage': len(self.stages) + 1,
+                    'Training Rows': len(df),
+                    'Holdout R²': float('nan'),
+                    'Holdout MAE': float('nan'),
+                    'Seconds': time.time() - started
+                })
+                self.live_stage = self.stages[-1]
+            self.status = "finished"
+        except Exception as e:
+            self.error = str(e)
+            self.status = "failed"
+
 # ========================================
 # ULTRA ACCURATE PRICE PREDICTION ENGINE
 # ========================================
 
 class UltraAccurateCarPricePredictor:
     def __init__(self):
-        self.model = None
+        # (model, encoders, version) replaced as one tuple so a concurrent
+        # prediction never pairs one model's encoders with another model
+        self.live_model = (None, {}, RULE_ENGINE_VERSION)
         self.scaler = StandardScaler()
-        self.encoders = {}
-        self.is_trained = False
         self.training_data = None
-        
+        # Fingerprint of the uploaded CSV behind training_data plus the options it was trained with
+        self.training_source = None
+        self.reference_stats = None
+        self.live_stats = None
+        self._contribution_matrix = None
+        self.catalog = CatalogMatcher()
+        try:
+            self.cache = ValuationCache()
+        except sqlite3.Error:
+            self.cache = None
+
+    @property
+    def model(self):
+        return self.live_model[0]
+
+    @property
+    def encoders(self):
+        return self.live_model[1]
+
+    @property
+    def model_version(self):
+        return self.live_model[2]
+
+    @property
+    def is_trained(self):
+        return self.live_model[0] is not None
+
     def get_base_price(self, brand, model):
         """Get accurate base price from database"""
         try:
+            if brand not in CAR_DATABASE or model not in CAR_DATABASE[brand]['models']:
+                brand, model, _ = self.catalog.match(brand, model)
             if brand in CAR_DATABASE and model in CAR_DATABASE[brand]['models']:
                 model_index = CAR_DATABASE[brand]['models'].index(model)
                 return CAR_DATABASE[brand]['base_prices'][model_index]
@@ -315,90 +1124,32 @@ class UltraAccurateCarPricePredictor:
         except:
             return 500000
 
+    def rule_price_factors(self, input_data):
+        """Ordered multiplicative factors behind calculate_accurate_price"""
+        base_price = self.get_base_price(input_data['Brand'], input_data['Model'])
+        car_age = datetime.now().year - float(input_data['Year'])
+        total_depreciation = age_depreciation(car_age) + mileage_impact(input_data['Mileage'])
+        
+        return [
+            ('Base Price', base_price),
+            ('Fuel Type', FUEL_MULTIPLIERS.get(input_data['Fuel_Type'], 1.0)),
+            ('Transmission', TRANSMISSION_MULTIPLIERS.get(input_data['Transmission'], 1.0)),
+            ('Age & Mileage', 1 - total_depreciation),
+            ('Condition', CONDITION_MULTIPLIERS[input_data['Condition']]),
+            ('Owner Type', OWNER_MULTIPLIERS[input_data['Owner_Type']]),
+            ('Registration City', CITY_PREMIUM.get(input_data['Registration_City'], 1.0)),
+            ('Insurance', INSURANCE_MULTIPLIERS.get(input_data['Insurance_Status'], 1.0))
+        ]
+
     def calculate_accurate_price(self, input_data):
         """Calculate ultra accurate price using advanced formula"""
         try:
-            base_price = self.get_base_price(input_data['Brand'], input_data['Model'])
-            
-            # Fuel type adjustment
-            fuel_multipliers = {
-                "Petrol": 1.0, "Diesel": 1.12, "CNG": 0.92, "Electric": 1.65, 
-                "Hybrid": 1.35, "LPG": 0.88, "Hydrogen": 1.75
-            }
-            base_price *= fuel_multipliers.get(input_data['Fuel_Type'], 1.0)
-            
-            # Transmission adjustment
-            transmission_multipliers = {
-                "Manual": 1.0, "Automatic": 1.18, "CVT": 1.15, "DCT": 1.22, 
-                "AMT": 1.08, "Sequential": 1.25, "Dual-Clutch": 1.23
-            }
-            base_price *= transmission_multipliers.get(input_data['Transmission'], 1.0)
-            
-            # Age depreciation
-            current_year = datetime.now().year
-            car_age = current_year - input_data['Year']
-            
-            if car_age == 0:
-                depreciation = 0.10
-            elif car_age == 1:
-                depreciation = 0.25
-            elif car_age == 2:
-                depreciation = 0.35
-            elif car_age == 3:
-                depreciation = 0.45
-            elif car_age == 4:
-                depreciation = 0.53
-            elif car_age == 5:
-                depreciation = 0.60
-            else:
-                depreciation = min(0.75, 0.60 + (car_age - 5) * 0.05)
-            
-            # Mileage impact
-            mileage = input_data['Mileage']
-            if mileage <= 10000:
-                mileage_impact = 0
-            elif mileage <= 30000:
-                mileage_impact = 0.03
-            elif mileage <= 50000:
-                mileage_impact = 0.07
-            elif mileage <= 80000:
-                mileage_impact = 0.12
-            elif mileage <= 120000:
-                mileage_impact = 0.18
-            elif mileage <= 200000:
-                mileage_impact = 0.25
-            else:
-                mileage_impact = 0.35
-            
-            total_depreciation = depreciation + mileage_impact
-            
-            # Condition multiplier
-            condition_multipliers = {
-                "Excellent": 0.92, "Very Good": 0.85, "Good": 0.75, "Fair": 0.60, "Poor": 0.45
-            }
-            
-            # Owner type multiplier
-            owner_multipliers = {
-                "First": 1.0, "Second": 0.88, "Third": 0.75, "Fourth & Above": 0.60
-            }
-            
-            # Calculate final price
-            depreciated_price = base_price * (1 - total_depreciation)
-            final_price = depreciated_price * condition_multipliers[input_data['Condition']] * owner_multipliers[input_data['Owner_Type']]
-            
-            # City adjustment
-            city_premium = {
-                "Delhi": 1.04, "Mumbai": 1.06, "Bangalore": 1.05, "Chennai": 1.02, 
-                "Pune": 1.03, "Hyderabad": 1.03, "London": 1.15, "New York": 1.18,
-                "Tokyo": 1.12, "Dubai": 1.20, "Paris": 1.14, "Berlin": 1.08
-            }
-            final_price *= city_premium.get(input_data['Registration_City'], 1.0)
+            factors = self.rule_price_factors(input_data)
             
-            # Insurance adjustment
-            if input_data['Insurance_Status'] == 'Comprehensive':
-                final_price *= 1.03
-            elif input_data['Insurance_Status'] == 'Expired':
-                final_price *= 0.98
+            # Multiply in the same order as the factor list so explanations add up exactly
+            final_price = factors[0][1]
+            for _, multiplier in factors[1:]:
+                final_price *= multiplier
             
             return max(100000, int(final_price))
             
@@ -466,11 +1217,80 @@ class UltraAccurateCarPricePredictor:
             st.error(f"Error loading CSV: {str(e)}")
             return None
 
-    def train_from_csv(self, df, selected_brand=None, selected_model=None):
-        """Train model from CSV data with optional filtering"""
+    def validate_training_data(self, df, enforce_catalog=True):
+        """Vectorized schema, range, whitelist and duplicate checks.
+
+        Returns (clean_df, rejected_df, reason_counts). Rejected rows carry a
+        'Rejection_Reasons' column listing every check they failed.
+        """
+        required_columns = ['Brand', 'Model', 'Year', 'Fuel_Type', 'Transmission',
+                            'Mileage', 'Condition', 'Price']
+        bit = {reason: np.int64(1) << i for i, reason in enumerate(REJECTION_REASONS)}
+        flags = np.zeros(len(df), dtype=np.int64)
+
+        def flag(reason, mask):
+            flags[np.asarray(mask, dtype=bool)] |= bit[reason]
+
+        # Only the columns the model uses may disqualify a row
+        missing = df[required_columns].isna()
+        flag('missing_value', missing.any(axis=1))
+
+        numeric = {}
+        for col in ['Year', 'Mileage', 'Price']:
+            numeric[col] = pd.to_numeric(df[col], errors='coerce')
+            flag('non_numeric', numeric[col].isna() & ~missing[col])
+            low, high = VALIDATION_RANGES[col]
+            if high is None:
+                high = datetime.now().year
+            out_of_range = (numeric[col] < low) | (numeric[col] > high)
+            flag(f'{col.lower()}_out_of_range', out_of_range)
+
+        if enforce_catalog:
+            brand = df['Brand'].astype(str)
+            flag('unknown_brand', ~brand.isin(list(CAR_DATABASE.keys())) & ~missing['Brand'])
+            catalog_pairs = pd.MultiIndex.from_tuples(
+                [(b, m) for b in CAR_DATABASE for m in CAR_DATABASE[b]['models']]
+            )
+            pairs = pd.MultiIndex.from_arrays([brand, df['Model'].astype(str)])
+            flag('unknown_model', ~pairs.isin(catalog_pairs) & brand.isin(list(CAR_DATABASE.keys())))
+            flag('unknown_fuel_type', ~df['Fuel_Type'].isin(FUEL_TYPES) & ~missing['Fuel_Type'])
+            flag('unknown_transmission', ~df['Transmission'].isin(TRANSMISSIONS) & ~missing['Transmission'])
+
+        if 'Car_ID' in df.columns:
+            flag('duplicate_car_id', df['Car_ID'].duplicated(keep='first') & df['Car_ID'].notna())
+
+        rejected_mask = flags != 0
+        clean = df.loc[~rejected_mask].copy()
+        for col, values in numeric.items():
+            clean[col] = values[~rejected_mask]
+
+        rejected = df.loc[rejected_mask].copy()
+        rejected_flags = pd.Series(flags[rejected_mask], index=rejected.index)
+        # Decode each distinct flag combination once instead of once per row
+        decoded = {
+            code: "; ".join(reason for reason in REJECTION_REASONS if code & bit[reason])
+            for code in rejected_flags.unique()
+        }
+        rejected['Rejection_Reasons'] = rejected_flags.map(decoded)
+
+        reason_counts = {
+            reason: int(np.count_nonzero(flags & bit[reason]))
+            for reason in REJECTION_REASONS
+        }
+        return clean, rejected, {k: v for k, v in reason_counts.items() if v}
+
+    def write_quarantine(self, rejected, path=QUARANTINE_PATH):
+        """Persist rejected rows with their reasons for later review"""
+        try:
+            rejected.to_csv(path, index=False)
+            return path
+        except Exception as e:
+            st.warning(f"Could not write quarantine file: {str(e)}")
+            return None
+
+    def prepare_training_data(self, df, selected_brand=None, selected_model=None, enforce_catalog=True):
+        """Map, filter, canonicalize and validate CSV data; None if unusable"""
         try:
-            st.info("🔄 Training advanced model from CSV data...")
-            
             df_processed = df.copy()
             
             # Handle Price_INR
@@ -506,6 +1326,15 @@ class UltraAccurateCarPricePredictor:
                     df_processed = df_processed[df_processed['Model'] == selected_model]
                     st.info(f"🔍 Filtered for model: {selected_model}")
             
+            # Canonical catalog labels for the base-price lookup and the encoders
+            df_processed, match_report = self.catalog.canonicalize_frame(df_processed)
+            if match_report is not None:
+                unmatched = match_report[match_report['Confidence'] == 0]
+                st.info(f"🔤 Matched {len(match_report) - len(unmatched)} of {len(match_report)} "
+                        f"brand/model names to the global database")
+                with st.expander("View Name Matching Report"):
+                    st.dataframe(match_report.sort_values('Confidence'))
+            
             # Required columns
             required_columns = ['Brand', 'Model', 'Year', 'Fuel_Type', 'Transmission', 
                               'Mileage', 'Condition', 'Price']
@@ -513,19 +1342,31 @@ class UltraAccurateCarPricePredictor:
             missing_columns = [col for col in required_columns if col not in df_processed.columns]
             if missing_columns:
                 st.error(f"Missing columns: {missing_columns}")
-                return False
+                return None
             
-            # Clean data
-            df_clean = df_processed.dropna()
+            # Validate data, quarantining rejected rows
+            df_clean, df_rejected, reason_counts = self.validate_training_data(
+                df_processed, enforce_catalog=enforce_catalog
+            )
+            if len(df_rejected) > 0:
+                quarantine_path = self.write_quarantine(df_rejected)
+                st.warning(f"⚠️ Rejected {len(df_rejected)} of {len(df_processed)} rows"
+                           + (f" (saved to '{quarantine_path}')" if quarantine_path else ""))
+                with st.expander("View Rejected Rows"):
+                    st.dataframe(pd.DataFrame(
+                        {'Reason': list(reason_counts.keys()), 'Rows': list(reason_counts.values())}
+                    ))
+                    st.dataframe(df_rejected.head(100))
+                    st.download_button("📥 Download Quarantine CSV",
+                                       df_rejected.to_csv(index=False).encode('utf-8'),
+                                       file_name=QUARANTINE_PATH, mime='text/csv')
+
             if len(df_clean) < 5:
                 st.error("Not enough data after cleaning")
-                return False
+                return None
             
             st.success(f"✅ Using {len(df_clean)} records for training")
             
-            # Prepare features
-            features = ['Brand', 'Model', 'Year', 'Fuel_Type', 'Transmission', 'Mileage', 'Condition']
-            X = df_clean[features]
             y = df_clean['Price']
             
             # Show filtered data summary
@@ -543,20 +1384,55 @@ class UltraAccurateCarPricePredictor:
                 with st.expander("View Filtered Data"):
                     st.dataframe(df_clean.head(10))
             
+            return df_clean
+            
+        except Exception as e:
+            st.error(f"Training error: {str(e)}")
+            return None
+
+    def encode_training_features(self, df_clean):
+        """Fit fresh label encoders; returns (X, encoders) without touching the live model"""
+        X = df_clean[MODEL_FEATURES].copy()
+        encoders = {}
+        for feature in CATEGORICAL_FEATURES:
+            encoders[feature] = LabelEncoder()
+            X[feature] = encoders[feature].fit_transform(X[feature].astype(str))
+        return X, encoders
+
+    def _publish_model(self, model, encoders, df_clean, source=None):
+        """Swap in a fitted model and reset everything derived from the previous one"""
+        previous_version = self.model_version
+        self.live_model = (model, encoders, f"rf-{datetime.now().strftime('%Y%m%d%H%M%S%f')}")
+        if self.cache is not None and previous_version != RULE_ENGINE_VERSION:
+            self.cache.invalidate(previous_version)
+        # Progressive training republishes on the same data; keep drift statistics across stages
+        if df_clean is not self.training_data:
+            self.training_data = df_clean
+            self.training_source = source
+            self.reference_stats = FeatureDriftMonitor.from_training_data(df_clean)
+            self.live_stats = self.reference_stats.spawn()
+
+    def train_from_csv(self, df, selected_brand=None, selected_model=None, enforce_catalog=True):
+        """Train model from CSV data with optional filtering"""
+        try:
+            st.info("🔄 Training advanced model from CSV data...")
+            
+            df_clean = self.prepare_training_data(df, selected_brand, selected_model, enforce_catalog)
+            if df_clean is None:
+                return False
+            y = df_clean['Price']
+            
             # Encode categorical variables
-            categorical_features = ['Brand', 'Model', 'Fuel_Type', 'Transmission', 'Condition']
-            for feature in categorical_features:
-                self.encoders[feature] = LabelEncoder()
-                X[feature] = self.encoders[feature].fit_transform(X[feature].astype(str))
+            X, encoders = self.encode_training_features(df_clean)
             
             # Train model
-            self.model = RandomForestRegressor(n_estimators=100, random_state=42)
-            self.model.fit(X, y)
-            self.is_trained = True
-            self.training_data = df_clean
+            model = RandomForestRegressor(n_estimators=100, random_state=42)
+            model.fit(X, y)
+            self._publish_model(model, encoders, df_clean,
+                                self.training_source_for(df, selected_brand, selected_model, enforce_catalog))
             
             # Evaluate
-            y_pred = self.model.predict(X)
+            y_pred = model.predict(X)
             r2 = r2_score(y, y_pred)
             mae = mean_absolute_error(y, y_pred)
             
@@ -567,27 +1443,492 @@ class UltraAccurateCarPricePredictor:
             st.error(f"Training error: {str(e)}")
             return False
 
-    def predict_price(self, input_data):
+    def start_progressive_training(self, df, selected_brand=None, selected_model=None, enforce_catalog=True):
+        """Prepare data here, then fit on growing samples in a background thread.
+
+        Returns the running ProgressiveTrainingJob, or None if the data is unusable.
+        """
+        st.info("🔄 Starting progressive training...")
+        df_clean = self.prepare_training_data(df, selected_brand, selected_model, enforce_catalog)
+        if df_clean is None:
+            return None
+        source = self.training_source_for(df, selected_brand, selected_model, enforce_catalog)
+        return ProgressiveTrainingJob(self, df_clean, source).start()
+
+    @staticmethod
+    def training_source_for(df, selected_brand=None, selected_model=None, enforce_catalog=True):
+        """Record of a raw training CSV and the train_from_csv options applied to it"""
+        return {
+            'fingerprint': dataset_fingerprint(df),
+            'options': {'selected_brand': selected_brand, 'selected_model': selected_model,
+                        'enforce_catalog': enforce_catalog}
+        }
+
+    def get_drift_report(self):
+        """Per-feature drift of live prediction inputs against training data"""
+        if self.reference_stats is None or self.live_stats is None:
+            return None
+        scores = self.live_stats.drift_scores(self.reference_stats)
+        rows = []
+        for feature, psi in scores.items():
+            is_numeric = feature in self.reference_stats.numeric_edges
+            rows.append({
+                'Feature': feature,
+                'PSI': psi,
+                'Training Mean': self.reference_stats.mean(feature) if is_numeric else None,
+                'Live Mean': self.live_stats.mean(feature) if is_numeric else None
+            })
+        return pd.DataFrame(rows)
+
+    def drift_detected(self, threshold=DRIFT_THRESHOLD):
+        """True once enough live requests are seen and any feature exceeds the threshold"""
+        report = self.get_drift_report()
+        if report is None or self.live_stats.count < DRIFT_MIN_SAMPLES:
+            return False
+        return bool((report['PSI'] > threshold).any())
+
+    def encode_features(self, df, encoders=None):
+        """Vectorized label encoding of the model features.
+
+        Returns (X, known) where known marks rows whose categories were all
+        seen during training and whose Year/Mileage parse as numbers; other
+        rows hold placeholder codes. Uses the live encoders unless a
+        snapshot's encoders are passed.
+        """
+        if encoders is None:
+            encoders = self.encoders
+        X = df[MODEL_FEATURES].copy()
+        known = np.ones(len(df), dtype=bool)
+        for feature in ['Year', 'Mileage']:
+            # Unparseable cells ("12,000 km") take the rule path, like a failed single-row predict
+            values = pd.to_numeric(df[feature], errors='coerce')
+            known &= ~(values.isna() & df[feature].notna()).to_numpy()
+            X[feature] = values.astype(float)
+        for feature in CATEGORICAL_FEATURES:
+            codes = pd.Index(encoders[feature].classes_).get_indexer(df[feature].astype(str))
+            known &= codes >= 0
+            X[feature] = np.where(codes >= 0, codes, 0)
+        return X, known
+
+    def _get_contribution_matrix(self, model):
+        """Sparse (forest nodes x features) matrix of per-edge value changes.
+
+        Built once per trained model and cached against that model. Each non-root node holds the change in
+        node mean from its parent, credited to the parent's split feature and
+        averaged over trees, so decision_path(X) @ matrix yields per-feature
+        contributions for a whole batch.
+        """
+        cached = self._contribution_matrix
+        if cached is None or cached[0] is not model:
+            rows, cols, data, bias = [], [], [], 0.0
+            n_trees = len(model.estimators_)
+            offset = 0
+            for estimator in model.estimators_:
+                tree = estimator.tree_
+                values = tree.value[:, 0, 0]
+                parents = np.full(tree.node_count, -1)
+                internal = np.flatnonzero(tree.children_left >= 0)
+                parents[tree.children_left[internal]] = internal
+                parents[tree.children_right[internal]] = internal
+                children = np.flatnonzero(parents >= 0)
+                rows.append(children + offset)
+                cols.append(tree.feature[parents[children]])
+                data.append((values[children] - values[parents[children]]) / n_trees)
+                bias += values[0] / n_trees
+                offset += tree.node_count
+            matrix = sparse.csr_matrix(
+                (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+                shape=(offset, len(MODEL_FEATURES))
+            )
+            cached = self._contribution_matrix = (model, matrix, bias)
+        return cached[1], cached[2]
+
+    def explain_predictions(self, df):
+        """Per-feature price contributions from the trained forest for a batch.
+
+        Returns a DataFrame with a 'Baseline' column (mean training price), one
+        column per model feature and the raw forest 'Prediction'; the baseline
+        plus contributions equals the prediction. Rows with categories unseen
+        in training are NaN, as predict_price prices them with the rule engine.
+        """
+        model, encoders, _ = self.live_model
+        df, _ = self.catalog.canonicalize_frame(df[MODEL_FEATURES])
+        X, known = self.encode_features(df, encoders)
+        matrix, bias = self._get_contribution_matrix(model)
+        contributions = np.full((len(df), len(MODEL_FEATURES)), np.nan)
+        known_rows = np.flatnonzero(known)
+        # Identical feature rows share a decision path; explain each combination once
+        codes, first = unique_row_codes(X.iloc[known_rows], MODEL_FEATURES)
+        unique_X = X.iloc[known_rows[first]]
+        unique_contributions = np.empty((len(unique_X), len(MODEL_FEATURES)))
+        # decision_path holds one entry per visited node, so chunk to bound memory
+        for start in range(0, len(unique_X), EXPLAIN_CHUNK_SIZE):
+            paths, _ = model.decision_path(unique_X.iloc[start:start + EXPLAIN_CHUNK_SIZE])
+            unique_contributions[start:start + EXPLAIN_CHUNK_SIZE] = (paths @ matrix).toarray()
+        contributions[known_rows] = unique_contributions[codes]
+        result = pd.DataFrame(contributions, columns=MODEL_FEATURES, index=df.index)
+        result.insert(0, 'Baseline', np.where(known, bias, np.nan))
+        result['Prediction'] = result['Baseline'] + result[MODEL_FEATURES].sum(axis=1, skipna=False)
+        return result
+
+    def predict_batch(self, df, track_drift=True, live_model=None):
+        """Price every row of a DataFrame, evaluating each distinct input once.
+
+        Batch pricing bypasses the valuation cache: dedup already prices each
+        distinct row once, and bulk files would evict interactive entries.
+
+        Rows are factorized on the trained model's features, or for the rule
+        engine on what it actually reads (base price, mileage bracket,
+        multiplier-table entries), and prices are broadcast back. Returns (prices, stats) where stats
+        reports the row count, unique evaluations and dedup ratio. Prices
+        with live_model, or one snapshot of the live model taken on entry.
+        """
+        model, encoders, _ = live_model or self.live_model
+        df, _ = self.catalog.canonicalize_frame(df[[c for c in RULE_FEATURES if c in df.columns]])
+        if track_drift and self.live_stats is not None:
+            self.live_stats.update_batch(df)
+        prices = np.zeros(len(df), dtype=np.int64)
+        rule_rows = np.arange(len(df))
+        unique_count = 0
+
+        if model is not None:
+            X, known = self.encode_features(df, encoders)
+            known_rows = np.flatnonzero(known)
+            codes, first = unique_row_codes(X.iloc[known_rows], MODEL_FEATURES)
+            if len(first):
+                unique_prices = model.predict(X.iloc[known_rows[first]])
+                prices[known_rows] = np.maximum(100000, unique_prices.astype(np.int64))[codes]
+            unique_count += len(first)
+            rule_rows = np.flatnonzero(~known)
+
+        if len(rule_rows):
+            rule_df = df.iloc[rule_rows][[c for c in RULE_FEATURES if c in df.columns]].copy()
+            for column, default in RULE_DEFAULTS.items():
+                if column not in rule_df.columns:
+                    rule_df[column] = default
+            # The rule engine only sees these columns through their multiplier
+            # table, so every value outside a table shares one key
+            for column, table in RULE_LOOKUP_MULTIPLIERS.items():
+                rule_df[column + '_Key'] = rule_df[column].where(rule_df[column].isin(list(table)), '')
+            # ...brand and model only through their base price...
+            pair_codes, pair_first = unique_row_codes(rule_df, ['Brand', 'Model'])
+            pairs = rule_df[['Brand', 'Model']].iloc[pair_first]
+            base_prices = np.array([self.get_base_price(b, m) for b, m in zip(pairs['Brand'], pairs['Model'])])
+            rule_df['Base_Price_Key'] = base_prices[pair_codes]
+            # ...and mileage only through its bracket
+            mileage = pd.to_numeric(rule_df['Mileage'], errors='coerce')
+            rule_df['Mileage_Key'] = np.searchsorted(MILEAGE_BRACKETS, mileage.to_numpy(dtype=float), side='left')
+            non_numeric = mileage.isna() & rule_df['Mileage'].notna()
+            if non_numeric.any():
+                # Keep unparseable values apart; mileage_bracket raises on them so they reach the fallback
+                rule_df['Mileage_Key'] = rule_df['Mileage_Key'].astype(str).where(
+                    ~non_numeric, rule_df['Mileage'].astype(str)
+                )
+            key_columns = ['Base_Price_Key', 'Year', 'Condition', 'Owner_Type', 'Mileage_Key']
+            key_columns += [c + '_Key' for c in RULE_LOOKUP_MULTIPLIERS]
+            codes, first = unique_row_codes(rule_df, key_columns)
+            records = rule_df.iloc[first].to_dict('records')
+            unique_prices = np.array([self.calculate_accurate_price(r) for r in records], dtype=np.int64)
+            prices[rule_rows] = unique_prices[codes]
+            unique_count += len(first)
+
+        stats = {
+            'rows': len(df),
+            'unique_rows': unique_count,
+            'dedup_ratio': len(df) / unique_count if unique_count else 1.0
+        }
+        return pd.Series(prices, index=df.index, name='Predicted_Price'), stats
+
+    def explain_rule_price(self, input_data):
+        """Step-by-step breakdown of calculate_accurate_price"""
+        input_data = self.catalog.canonicalize_input(input_data)
+        rows = []
+        price = None
+        for factor, multiplier in self.rule_price_factors(input_data):
+            previous = price
+            price = multiplier if previous is None else price * multiplier
+            rows.append({
+                'Factor': factor,
+                'Multiplier': None if previous is None else multiplier,
+                'Impact': price if previous is None else price - previous,
+                'Price': price
+            })
+        if price < 100000:
+            rows.append({'Factor': 'Minimum Price', 'Multiplier': None,
+                         'Impact': 100000 - price, 'Price': 100000})
+        return pd.DataFrame(rows)
+
+    def cache_key(self, input_data, live_model=None):
+        """Normalized input tuple that determines the predicted price.
+
+        The rule engine only sees mileage through its bracket, so untrained
+        predictions share entries per bracket; a trained forest needs the
+        exact mileage. The current year is included because both paths
+        price by car age.
+        """
+        if (live_model or self.live_model)[0] is not None:
+            mileage = float(input_data['Mileage'])
+        else:
+            mileage = f"bracket-{mileage_bracket(input_data['Mileage'])}"
+        key = [datetime.now().year, mileage, float(input_data['Year'])]
+        key += [str(input_data.get(f, '')).strip() for f in
+                ['Brand', 'Model', 'Fuel_Type', 'Transmission', 'Condition',
+                 'Owner_Type', 'Insurance_Status', 'Registration_City']]
+        return json.dumps(key)
+
+    def predict_price(self, input_data, track_drift=True):
         """Main prediction function"""
-        if self.is_trained:
+        input_data = self.catalog.canonicalize_input(input_data)
+        if track_drift and self.live_stats is not None:
+            self.live_stats.update(input_data)
+        # One snapshot so the price and its cache entry come from the same model
+        live_model = self.live_model
+        if self.cache is None:
+            return self._predict_uncached(input_data, live_model)
+        try:
+            key = self.cache_key(input_data, live_model)
+        except (KeyError, TypeError, ValueError):
+            return self._predict_uncached(input_data, live_model)
+        price = self.cache.get(key, live_model[2])
+        if price is None:
+            price = self._predict_uncached(input_data, live_model)
+            self.cache.put(key, live_model[2], price)
+        return price
+
+    def _predict_uncached(self, input_data, live_model):
+        model, encoders, _ = live_model
+        if model is not None:
             try:
-                features = ['Brand', 'Model', 'Year', 'Fuel_Type', 'Transmission', 'Mileage', 'Condition']
                 input_df = pd.DataFrame([input_data])
                 
-                for feature in ['Brand', 'Model', 'Fuel_Type', 'Transmission', 'Condition']:
-                    if feature in self.encoders:
+                for feature in CATEGORICAL_FEATURES:
+                    if feature in encoders:
                         try:
-                            input_df[feature] = self.encoders[feature].transform([input_data[feature]])[0]
+                            input_df[feature] = encoders[feature].transform([input_data[feature]])[0]
                         except:
                             return self.calculate_accurate_price(input_data)
                 
-                prediction = self.model.predict(input_df[features])[0]
+                prediction = model.predict(input_df[MODEL_FEATURES])[0]
                 return max(100000, int(prediction))
             except:
                 return self.calculate_accurate_price(input_data)
         else:
             return self.calculate_accurate_price(input_data)
 
+# ========================================
+# MONTE CARLO PORTFOLIO VALUATION
+# ========================================
+
+PORTFOLIO_SCENARIOS = 1000
+PORTFOLIO_HOLDING_YEARS = (1, 3)          # inclusive range, drawn once per scenario
+PORTFOLIO_ANNUAL_MILEAGE = (12000, 4000)  # mean and standard deviation, km per year
+PORTFOLIO_DOWNGRADE_RATE = 0.15           # yearly chance of dropping one condition grade
+PORTFOLIO_OWNER_CHANGE_RATE = 0.10        # yearly chance of an ownership transfer
+PORTFOLIO_CHUNK_CELLS = 500000            # vehicles x scenarios priced per task
+PORTFOLIO_POOL_MIN_WORK = 20000000        # cells (x trees when trained) before a process pool pays off
+PORTFOLIO_QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+CONDITION_FACTORS = np.array([CONDITION_MULTIPLIERS[c] for c in CAR_CONDITIONS])
+OWNER_FACTORS = np.array([OWNER_MULTIPLIERS[o] for o in OWNER_TYPES])
+
+# Set per pool worker by the initializer so the forest is not pickled per task
+_portfolio_model = None
+
+def _init_portfolio_worker(model):
+    global _portfolio_model
+    _portfolio_model = model
+
+def _value_portfolio_chunk(task):
+    """Price every scenario for one chunk of vehicles.
+
+    Returns an (n_scenarios, n_segments) array of summed values; the
+    scenario x vehicle price matrix never leaves the worker.
+    """
+    v = task['vehicles']
+    holding = task['holding'][:, None]
+    rng = np.random.default_rng(task['seed'])
+    shape = (len(holding), len(v['base']))
+
+    annual = np.maximum(0, rng.normal(task['mileage_mean'], task['mileage_sd'], shape))
+    mileage = v['mileage'] + annual * holding
+    condition = np.minimum(v['condition'] + rng.binomial(holding, task['downgrade_rate'], shape),
+                           len(CAR_CONDITIONS) - 1)
+    owner = np.minimum(v['owner'] + rng.binomial(holding, task['owner_change_rate'], shape),
+                       len(OWNER_TYPES) - 1)
+    prices = rule_prices_array(v['base'], v['fuel'], v['transmission'], v['age'] + holding, mileage,
+                               CONDITION_FACTORS[condition], OWNER_FACTORS[owner], v['city'], v['insurance'])
+
+    model = task.get('model', _portfolio_model)
+    if model is not None and 'forest' in v:
+        condition_codes = task['condition_codes'][condition]
+        mask = v['forest'] & (condition_codes >= 0)
+        if mask.any():
+            s_idx, v_idx = np.nonzero(mask)
+            X = pd.DataFrame({
+                'Brand': v['brand_code'][v_idx],
+                'Model': v['model_code'][v_idx],
+                # Holding a car for h years prices it like a car built h years earlier today
+                'Year': v['year'][v_idx] - task['holding'][s_idx],
+                'Fuel_Type': v['fuel_code'][v_idx],
+                'Transmission': v['transmission_code'][v_idx],
+                'Mileage': mileage[mask],
+                'Condition': condition_codes[mask]
+            }, columns=MODEL_FEATURES)
+            prices[mask] = np.maximum(100000, model.predict(X).astype(np.int64))
+
+    return (task['segments'].T @ prices.T.astype(float)).T
+
+class PortfolioValuationEngine:
+    """Monte Carlo value distribution for a whole fleet.
+
+    Each scenario draws a holding period; each vehicle then draws its
+    mileage added per year, condition downgrades and owner changes over
+    that period. All vehicles x scenarios are priced as vectorized batches,
+    with the trained forest where its labels are known and the rule engine
+    otherwise. Vehicle chunks are spread over a process pool and bounded to
+    PORTFOLIO_CHUNK_CELLS cells each, so memory does not grow with the
+    number of scenarios times fleet size.
+    """
+
+    def __init__(self, predictor, n_scenarios=PORTFOLIO_SCENARIOS, holding_years=PORTFOLIO_HOLDING_YEARS,
+                 annual_mileage=PORTFOLIO_ANNUAL_MILEAGE, downgrade_rate=PORTFOLIO_DOWNGRADE_RATE,
+                 owner_change_rate=PORTFOLIO_OWNER_CHANGE_RATE, workers=None, seed=42):
+        self.predictor = predictor
+        self.n_scenarios = n_scenarios
+        self.holding_years = holding_years
+        self.annual_mileage = annual_mileage
+        self.downgrade_rate = downgrade_rate
+        self.owner_change_rate = owner_change_rate
+        self.workers = workers or os.cpu_count() or 1
+        self.seed = seed
+
+    def _vehicle_arrays(self, df, live_model):
+        """Per-vehicle factor arrays plus a mask of vehicles that can be priced"""
+        predictor = self.predictor
+        year = pd.to_numeric(df['Year'], errors='coerce')
+        mileage = pd.to_numeric(df['Mileage'], errors='coerce')
+        condition = pd.Index(CAR_CONDITIONS).get_indexer(df['Condition'])
+        owner = pd.Index(OWNER_TYPES).get_indexer(df['Owner_Type'])
+        valid = (year.notna() & mileage.notna()).to_numpy() & (condition >= 0) & (owner >= 0)
+
+        codes, first = unique_row_codes(df, ['Brand', 'Model'])
+        pairs = df[['Brand', 'Model']].iloc[first]
+        base = np.array([predictor.get_base_price(b, m) for b, m in zip(pairs['Brand'], pairs['Model'])])
+
+        vehicles = {
+            'base': base[codes] if len(codes) else np.zeros(0),
+            'fuel': df['Fuel_Type'].map(FUEL_MULTIPLIERS).fillna(1.0).to_numpy(dtype=float),
+            'transmission': df['Transmission'].map(TRANSMISSION_MULTIPLIERS).fillna(1.0).to_numpy(dtype=float),
+            'city': df['Registration_City'].map(CITY_PREMIUM).fillna(1.0).to_numpy(dtype=float),
+            'insurance': df['Insurance_Status'].map(INSURANCE_MULTIPLIERS).fillna(1.0).to_numpy(dtype=float),
+            'year': year.to_numpy(dtype=float),
+            'age': datetime.now().year - year.to_numpy(dtype=float),
+            'mileage': mileage.to_numpy(dtype=float),
+            'condition': condition,
+            'owner': owner
+        }
+        model, encoders, _ = live_model
+        if model is not None:
+            X, known = predictor.encode_features(df, encoders)
+            vehicles['forest'] = known
+            for feature, key in [('Brand', 'brand_code'), ('Model', 'model_code'),
+                                 ('Fuel_Type', 'fuel_code'), ('Transmission', 'transmission_code')]:
+                vehicles[key] = X[feature].to_numpy()
+        vehicles = {k: np.asarray(a)[valid] for k, a in vehicles.items()}
+        return vehicles, valid
+
+    def value(self, fleet, segment_column='Brand'):
+        """Simulate the fleet; returns portfolio quantiles and a per-segment table"""
+        started = time.time()
+        columns = [c for c in RULE_FEATURES if c in fleet.columns]
+        df, _ = self.predictor.catalog.canonicalize_frame(fleet[columns])
+        for column, default in RULE_DEFAULTS.items():
+            if column not in df.columns:
+                df[column] = default
+        if segment_column in df.columns:
+            segment_values = df[segment_column]
+        elif segment_column in fleet.columns:
+            segment_values = fleet[segment_column]
+        else:
+            segment_values = pd.Series('All', index=fleet.index)
+
+        # Snapshot the live model so a training run publishing mid-simulation cannot mix models
+        live_model = self.predictor.live_model
+        model, encoders, _ = live_model
+        vehicles, valid = self._vehicle_arrays(df, live_model)
+        current_prices, _ = self.predictor.predict_batch(df[valid], track_drift=False, live_model=live_model)
+        current_prices = current_prices.to_numpy()
+        segment_codes, segment_names = pd.factorize(segment_values.astype(str).to_numpy()[valid])
+        n_vehicles, n_segments = len(segment_codes), len(segment_names)
+        segments = sparse.csr_matrix(
+            (np.ones(n_vehicles), (np.arange(n_vehicles), segment_codes)), shape=(n_vehicles, n_segments)
+        )
+
+        seeds = np.random.SeedSequence(self.seed)
+        holding_rng = np.random.default_rng(seeds.spawn(1)[0])
+        low, high = self.holding_years
+        holding = holding_rng.integers(low, high + 1, self.n_scenarios)
+
+        chunk = max(1, PORTFOLIO_CHUNK_CELLS // self.n_scenarios)
+        starts = range(0, n_vehicles, chunk)
+        condition_codes = np.full(len(CAR_CONDITIONS), -1)
+        if model is not None:
+            condition_codes = pd.Index(encoders['Condition'].classes_).get_indexer(CAR_CONDITIONS)
+        tasks = [{
+            'vehicles': {k: a[start:start + chunk] for k, a in vehicles.items()},
+            'segments': segments[start:start + chunk],
+            'holding': holding,
+            'seed': child,
+            'mileage_mean': self.annual_mileage[0],
+            'mileage_sd': self.annual_mileage[1],
+            'downgrade_rate': self.downgrade_rate,
+            'owner_change_rate': self.owner_change_rate,
+            'condition_codes': condition_codes
+        } for start, child in zip(starts, seeds.spawn(len(starts)))]
+
+        segment_totals = np.zeros((self.n_scenarios, n_segments))
+        executor = None
+        work = n_vehicles * self.n_scenarios * (len(model.estimators_) if model is not None else 1)
+        # Spawned workers spend seconds importing the app, so small runs stay serial
+        if self.workers > 1 and len(tasks) > 1 and work >= PORTFOLIO_POOL_MIN_WORK:
+            # Never fork the threaded Streamlit server (training jobs, the cache's
+            # SQLite lock); forkserver/spawn workers re-import this module instead
+            # and receive the model once through the initializer
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+            executor = ProcessPoolExecutor(max_workers=min(self.workers, len(tasks)), mp_context=context,
+                                           initializer=_init_portfolio_worker, initargs=(model,))
+        if executor is None:
+            for task in tasks:
+                segment_totals += _value_portfolio_chunk(dict(task, model=model))
+        else:
+            with executor:
+                for result in executor.map(_value_portfolio_chunk, tasks):
+                    segment_totals += result
+
+        totals = segment_totals.sum(axis=1)
+        current_by_segment = pd.Series(current_prices).groupby(segment_codes).sum()
+        segment_table = pd.DataFrame({
+            'Segment': segment_names,
+            'Vehicles': np.bincount(segment_codes, minlength=n_segments),
+            'Current Value': current_by_segment.reindex(range(n_segments), fill_value=0).to_numpy(),
+            'Mean': segment_totals.mean(axis=0)
+        })
+        for q in PORTFOLIO_QUANTILES:
+            segment_table[f'P{int(q * 100)}'] = np.quantile(segment_totals, q, axis=0)
+
+        portfolio = {'Current Value': float(current_prices.sum()), 'Mean': float(totals.mean())}
+        portfolio.update({f'P{int(q * 100)}': float(np.quantile(totals, q)) for q in PORTFOLIO_QUANTILES})
+        return {
+            'portfolio': portfolio,
+            'segments': segment_table.sort_values('Mean', ascending=False).reset_index(drop=True),
+            'scenario_totals': totals,
+            'holding_years': holding,
+            'vehicles': n_vehicles,
+            'skipped': int((~valid).sum()),
+            'seconds': time.time() - started
+        }
+
 # ========================================
 # STREAMLIT UI COMPONENTS
 # ========================================
@@ -612,7 +1953,9 @@ def main():
             "🎯 Price Prediction", 
             "📊 Market Analysis",
             "📁 CSV Training",
-            "🌍 Brand Explorer"
+            "🌍 Brand Explorer",
+            "📡 Drift Monitor",
+            "💼 Portfolio Valuation"
         ])
         
         st.markdown("---")
@@ -626,6 +1969,15 @@ def main():
         - 🌎 Worldwide
         - 💎 Luxury & Super Luxury
         """)
+        
+        cache = st.session_state.predictor.cache
+        if cache is not None:
+            st.subheader("⚡ Valuation Cache")
+            stats = cache.stats()
+            st.caption(f"Hits: {stats['hits']:,} · Misses: {stats['misses']:,} · "
+                       f"Hit rate: {stats['hit_rate']:.0%} · Entries: {stats['entries']:,}")
+            if st.button("Clear Cache"):
+                cache.invalidate()
     
     # Page routing
     if page == "🎯 Price Prediction":
@@ -636,6 +1988,10 @@ def main():
         show_csv_training()
     elif page == "🌍 Brand Explorer":
         show_brand_explorer()
+    elif page == "📡 Drift Monitor":
+        show_drift_monitor()
+    elif page == "💼 Portfolio Valuation":
+        show_portfolio_valuation()
 
 def show_prediction_interface():
     st.subheader("🎯 Ultra Accurate Price Prediction")
@@ -696,6 +2052,39 @@ def show_prediction_interface():
                 st.metric("Original Price", f"₹{base_price:,}")
             with col2:
                 st.metric("Total Depreciation", f"₹{depreciation:,}", f"-{depreciation_percent:.1f}%")
+            
+            show_price_breakdown(st.session_state.predictor, input_data)
+
+def show_price_breakdown(predictor, input_data):
+    st.subheader("🔍 Why This Price?")
+    
+    try:
+        explanation = None
+        if predictor.is_trained:
+            explanation = predictor.explain_predictions(pd.DataFrame([input_data])).iloc[0]
+        
+        if explanation is not None and not explanation.isna().any():
+            labels = ['Average Training Price'] + MODEL_FEATURES
+            values = [explanation['Baseline']] + [explanation[f] for f in MODEL_FEATURES]
+            caption = "Contribution of each feature along the model's decision paths."
+        else:
+            breakdown = predictor.explain_rule_price(input_data)
+            labels = breakdown['Factor'].tolist()
+            values = breakdown['Impact'].tolist()
+            caption = "Effect of each pricing factor, applied in order."
+    except Exception:
+        st.info("A breakdown is not available for this car.")
+        return
+    
+    fig = go.Figure(go.Waterfall(
+        x=labels + ['Predicted Price'],
+        y=values + [0],
+        measure=['absolute'] + ['relative'] * (len(values) - 1) + ['total'],
+        text=[f"₹{v:,.0f}" for v in values] + [""]
+    ))
+    fig.update_layout(title="Price Breakdown", showlegend=False)
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(caption)
 
 def show_market_analysis():
     st.subheader("📊 Car Market Analysis")
@@ -723,7 +2112,7 @@ def show_market_analysis():
                     'Owner_Type': 'First', 'Insurance_Status': 'Comprehensive',
                     'Registration_City': 'Mumbai'
                 }
-                price = st.session_state.predictor.predict_price(input_data)
+                price = st.session_state.predictor.predict_price(input_data, track_drift=False)
                 price_data.append({'Year': year, 'Price': price, 'Age': years_old})
             
             price_df = pd.DataFrame(price_data)
@@ -769,6 +2158,9 @@ def show_csv_training():
         df = st.session_state.predictor.load_csv_data(uploaded_file)
         
         if df is not None:
+            # Kept so the drift monitor can retrain on the latest market data
+            st.session_state.latest_training_csv = df
+
             st.write("### Dataset Preview")
             st.dataframe(df.head())
             
@@ -801,16 +2193,127 @@ def show_csv_training():
                 if selected_model != "All":
                     filtered_df = filtered_df[filtered_df['Model'] == selected_model]
                 st.info(f"📊 Will train on {len(filtered_df)} records after filtering")
-            
+
+            enforce_catalog = st.checkbox(
+                "Reject brands, models, fuel types and transmissions not in the global database",
+                value=True
+            )
+
+            progressive = st.checkbox(
+                "Progressive training (publish a model from a sample within seconds, refine in the background)",
+                value=len(df) > PROGRESSIVE_INITIAL_SAMPLE * PROGRESSIVE_GROWTH
+            )
+
             if st.button("🚀 Train Model from CSV", type="primary"):
-                success = st.session_state.predictor.train_from_csv(
-                    df, 
-                    selected_brand if selected_brand != "All" else None,
-                    selected_model if selected_model != "All" else None
-                )
-                if success:
-                    st.balloons()
-                    st.success("Model trained successfully! Now using AI for predictions.")
+                job = st.session_state.get('training_job')
+                if progressive and job is not None and not job.done:
+                    st.warning("A progressive training run is already in progress.")
+                elif progressive:
+                    st.session_state.training_job = st.session_state.predictor.start_progressive_training(
+                        df,
+                        selected_brand if selected_brand != "All" else None,
+                        selected_model if selected_model != "All" else None,
+                        enforce_catalog=enforce_catalog
+                    )
+                else:
+                    if job is not None and not job.done:
+                        # Otherwise its later stages would publish over the one-shot model
+                        with st.spinner("Stopping the progressive training run..."):
+                            job.cancel(wait=True)
+                    success = st.session_state.predictor.train_from_csv(
+                        df,
+                        selected_brand if selected_brand != "All" else None,
+                        selected_model if selected_model != "All" else None,
+                        enforce_catalog=enforce_catalog
+                    )
+                    if success:
+                        st.balloons()
+                        st.success("Model trained successfully! Now using AI for predictions.")
+            
+            if st.session_state.get('training_job') is not None:
+                show_training_progress()
+            
+            st.subheader("💰 Batch Pricing")
+            missing = [col for col in MODEL_FEATURES if col not in df.columns]
+            if missing:
+                st.caption(f"Batch pricing needs columns: {missing}")
+            elif st.button("💰 Price All Cars in This File"):
+                with st.spinner("Pricing unique car configurations..."):
+                    prices, stats = st.session_state.predictor.predict_batch(df)
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    st.metric("Rows", f"{stats['rows']:,}")
+                with col2:
+                    st.metric("Unique Configurations Priced", f"{stats['unique_rows']:,}")
+                with col3:
+                    st.metric("Dedup Ratio", f"{stats['dedup_ratio']:.1f}x")
+                priced = df.assign(Predicted_Price=prices)
+                st.dataframe(priced.head(100))
+                st.download_button("📥 Download Prices",
+                                   priced.to_csv(index=False).encode('utf-8'),
+                                   file_name="predicted_prices.csv", mime='text/csv')
+            
+            if st.session_state.predictor.is_trained:
+                if missing:
+                    st.caption(f"Price explanations need columns: {missing}")
+                elif st.button("🔍 Explain Prices for This File"):
+                    with st.spinner("Decomposing predictions..."):
+                        explanations = st.session_state.predictor.explain_predictions(df)
+                    st.dataframe(explanations.head(100))
+                    st.download_button("📥 Download Explanations",
+                                       explanations.to_csv().encode('utf-8'),
+                                       file_name="price_explanations.csv", mime='text/csv')
+
+def _render_training_progress():
+    job = st.session_state.training_job
+    st.subheader("⏳ Progressive Training")
+    if job.stages:
+        live = job.live_stage or job.stages[-1]
+        # The all-data stage trains on the holdout, so show the last score measured before it
+        scored = live if pd.notna(live['Holdout MAE']) else next(
+            (s for s in reversed(job.stages) if pd.notna(s['Holdout MAE'])), live
+        )
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Live Model Rows", f"{live['Training Rows']:,}")
+        with col2:
+            st.metric("Holdout R²", f"{scored['Holdout R²']:.3f}")
+        with col3:
+            st.metric("Holdout MAE", f"₹{scored['Holdout MAE']:,.0f}")
+        st.dataframe(pd.DataFrame(job.stages))
+    
+    if job.status == "running":
+        st.info("Training on larger samples in the background; predictions already use the latest model.")
+        if st.button("⏹️ Stop Training"):
+            job.cancel()
+    elif job.status == "failed":
+        st.error(f"Training error: {job.error}")
+    elif job.status == "plateaued":
+        st.success(f"✅ Accuracy plateaued; stopped early with the best-scoring model "
+                   f"(stage {job.live_stage['Stage']}).")
+    elif job.status == "finished":
+        st.success("✅ Final model trained on all data, holdout included.")
+    elif job.status == "cancelled":
+        st.warning("Training stopped; the latest published model stays in use.")
+
+# Re-render the progress panel on a timer where this Streamlit version supports fragments
+if hasattr(st, "fragment"):
+    @st.fragment(run_every=2)
+    def _poll_training_progress():
+        if st.session_state.training_job.done:
+            # A full rerun redraws the finished job below without the timer
+            st.rerun()
+        _render_training_progress()
+
+    def show_training_progress():
+        if st.session_state.training_job.done:
+            _render_training_progress()
+        else:
+            _poll_training_progress()
+else:
+    def show_training_progress():
+        _render_training_progress()
+        st.button("🔄 Refresh Progress")
 
 def show_brand_explorer():
     st.subheader("🌍 Global Brand Explorer")
@@ -842,5 +2345,125 @@ def show_brand_explorer():
                         for i, model in enumerate(models):
                             st.write(f"• {model} - ₹{prices[i]:,}")
 
+def show_drift_monitor():
+    st.subheader("📡 Market Drift Monitor")
+    
+    predictor = st.session_state.predictor
+    report = predictor.get_drift_report()
+    if report is None:
+        st.info("Train a model from CSV to establish the reference distribution for drift monitoring.")
+        return
+    
+    threshold = st.slider("Drift threshold (PSI)", 0.05, 1.0, DRIFT_THRESHOLD, 0.05)
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Training Records", f"{predictor.reference_stats.count:,}")
+    with col2:
+        st.metric("Live Requests", f"{predictor.live_stats.count:,}")
+    with col3:
+        st.metric("Max PSI", f"{report['PSI'].max():.3f}")
+    
+    if predictor.live_stats.count < DRIFT_MIN_SAMPLES:
+        st.info(f"Drift scores stabilise after {DRIFT_MIN_SAMPLES} live requests.")
+    
+    fig = px.bar(report, x='Feature', y='PSI', title='Population Stability Index by Feature',
+                 color='PSI', color_continuous_scale='RdYlGn_r')
+    fig.add_hline(y=threshold, line_dash="dash", line_color="red")
+    st.plotly_chart(fig, use_container_width=True)
+    st.dataframe(report)
+    
+    drifted = predictor.drift_detected(threshold)
+    if drifted:
+        st.error("⚠️ Live inputs have drifted away from the training data.")
+    else:
+        st.success("✅ No significant drift detected.")
+    
+    latest_csv = st.session_state.get('latest_training_csv')
+    source = predictor.training_source
+    job = st.session_state.get('training_job')
+    auto_retrain = st.checkbox("Automatically retrain on the latest uploaded CSV when drift exceeds the threshold")
+    if latest_csv is None:
+        st.caption("Upload a CSV on the training page to enable retraining.")
+    elif job is not None and not job.done:
+        st.caption("A progressive training run is in progress.")
+    elif source is not None and dataset_fingerprint(latest_csv) == source['fingerprint']:
+        # Refitting on the same data only resets the alarm without adapting the model
+        st.caption("The live model was trained on the latest uploaded CSV. "
+                   "Upload newer market data on the training page to retrain.")
+    elif (drifted and auto_retrain) or st.button("🔄 Retrain Now"):
+        options = source['options'] if source is not None else {}
+        if predictor.train_from_csv(latest_csv, **options):
+            st.success("Model retrained; drift statistics have been reset.")
+
+def show_portfolio_valuation():
+    st.subheader("💼 Fleet Portfolio Valuation")
+    
+    st.info("""
+    **Upload a fleet inventory to simulate its future value distribution.**
+    Each scenario draws a holding period, then extra mileage, condition downgrades and owner changes per car.
+    """)
+    
+    uploaded_file = st.file_uploader("Choose fleet CSV file", type=['csv'], key="portfolio_file")
+    if uploaded_file is None:
+        return
+    fleet = st.session_state.predictor.load_csv_data(uploaded_file)
+    if fleet is None:
+        return
+    
+    missing = [col for col in MODEL_FEATURES + ['Owner_Type'] if col not in fleet.columns]
+    if missing:
+        st.error(f"Missing columns: {missing}")
+        return
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        segment_options = list(fleet.select_dtypes(exclude='number').columns)
+        segment_column = st.selectbox("Segment By", segment_options,
+                                      index=segment_options.index('Brand') if 'Brand' in segment_options else 0)
+        n_scenarios = st.slider("Scenarios", 100, 5000, PORTFOLIO_SCENARIOS, 100)
+        holding_years = st.slider("Holding Period (years)", 0, 10, PORTFOLIO_HOLDING_YEARS)
+    with col2:
+        mileage_mean = st.number_input("Annual Mileage (km)", 0, 100000, PORTFOLIO_ANNUAL_MILEAGE[0], 1000)
+        mileage_sd = st.number_input("Annual Mileage Std Dev (km)", 0, 50000, PORTFOLIO_ANNUAL_MILEAGE[1], 500)
+        downgrade_rate = st.slider("Yearly Condition Downgrade Chance", 0.0, 1.0, PORTFOLIO_DOWNGRADE_RATE, 0.01)
+        owner_change_rate = st.slider("Yearly Owner Change Chance", 0.0, 1.0, PORTFOLIO_OWNER_CHANGE_RATE, 0.01)
+    
+    if st.button("🎲 Run Portfolio Simulation", type="primary"):
+        engine = PortfolioValuationEngine(
+            st.session_state.predictor, n_scenarios=n_scenarios, holding_years=holding_years,
+            annual_mileage=(mileage_mean, mileage_sd), downgrade_rate=downgrade_rate,
+            owner_change_rate=owner_change_rate
+        )
+        with st.spinner(f"Simulating {n_scenarios:,} scenarios for {len(fleet):,} vehicles..."):
+            result = engine.value(fleet, segment_column)
+        
+        portfolio = result['portfolio']
+        st.success(f"✅ Valued {result['vehicles']:,} vehicles x {n_scenarios:,} scenarios "
+                   f"in {result['seconds']:.1f}s")
+        if result['skipped']:
+            st.warning(f"⚠️ Skipped {result['skipped']} vehicles with unusable year, mileage, condition or owner type")
+        
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Current Value", f"₹{portfolio['Current Value']:,.0f}")
+        with col2:
+            st.metric("P5 (Downside)", f"₹{portfolio['P5']:,.0f}")
+        with col3:
+            st.metric("Median", f"₹{portfolio['P50']:,.0f}")
+        with col4:
+            st.metric("P95 (Upside)", f"₹{portfolio['P95']:,.0f}")
+        
+        fig = px.histogram(x=result['scenario_totals'], nbins=50,
+                           title='Simulated Portfolio Value Distribution',
+                           labels={'x': 'Portfolio Value (₹)'})
+        st.plotly_chart(fig, use_container_width=True)
+        
+        st.subheader("📊 Segment Breakdown")
+        st.dataframe(result['segments'])
+        st.download_button("📥 Download Segment Breakdown",
+                           result['segments'].to_csv(index=False).encode('utf-8'),
+                           file_name="portfolio_valuation.csv", mime='text/csv')
+
 if __name__ == "__main__":
     main()